@@ -1,36 +1,141 @@
+import io
+import base64
 import os
+import re
+import atexit
+import hashlib
+import gzip
+import shutil
 import json
 import time
+import orjson
 import uuid
 from pathlib import Path
-from datetime import datetime
-from flask import Flask, request, jsonify
+from datetime import date, datetime
+from flask import Flask, Response, request, stream_with_context
 from flask_socketio import SocketIO, emit
-from faster_whisper import WhisperModel
-from waitress import serve
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import ctranslate2
+import numpy as np
 import google.generativeai as genai
-from dataclasses import dataclass, asdict
+from json_repair import repair_json
+from dragon_hot import (
+    FieldPattern, FieldValue, JsonObjectScanner, compile_field_patterns,
+    extract_fields, match_fields, strip_code_fences
+)
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, List, Optional
 import threading
-from queue import Queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+from collections import OrderedDict, deque
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-# Set up detailed logging
+# Set up detailed logging. Records are handed to a background listener
+# thread so stream I/O never blocks a request thread.
+_log_queue = Queue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s | %(levelname)-8s | %(message)s'))
+log_listener = QueueListener(_log_queue, _log_handler, respect_handler_level=True)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(message)s'
+    format='%(message)s',  # the listener's handler applies the real format
+    handlers=[QueueHandler(_log_queue)]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # --- Configuration ---
-MODEL_SIZE = "medium.en"
+# MODEL_SIZE may also point at a directory pre-converted with
+# `ct2-transformers-converter --quantization int8_float16` so the weights
+# are not re-quantized on every boot.
+MODEL_SIZE = os.getenv("WHISPER_MODEL", "medium.en")
 DEVICE = "cuda"
-COMPUTE_TYPE = "float16"
+COMPUTE_TYPE = os.getenv("ASR_QUANTIZATION", "int8_float16")
+COMPUTE_TYPE_FALLBACKS = ["int8_float16", "float16", "auto"]
+# Optional short clip used to check int8 weights against a float16 baseline
+# at boot; if avg_logprob drops by more than the max drift, float16 is used
+WHISPER_CALIBRATION_AUDIO = os.getenv("WHISPER_CALIBRATION_AUDIO", "")
+WHISPER_CALIBRATION_MAX_DRIFT = float(os.getenv("WHISPER_CALIBRATION_MAX_DRIFT", "0.1"))
+# Single-speaker dictation gains little from wide beams; greedy is ~5x cheaper
+BEAM_SIZE = int(os.getenv("BEAM_SIZE", "1"))
+TRANSCRIBE_OPTIONS = dict(
+    beam_size=BEAM_SIZE,
+    vad_filter=True,
+    vad_parameters=dict(min_silence_duration_ms=500),
+    # BatchedInferencePipeline decodes at a single temperature (it only
+    # takes temperature[0]) and never conditions on previous text, so
+    # there is no temperature fallback on the serving path
+    temperature=0.0,
+    condition_on_previous_text=False,
+)
+# Number of 30s audio windows decoded per GPU call by the batched pipeline
+GPU_BATCH_SIZE = int(os.getenv("GPU_BATCH_SIZE", "8"))
+# Beam sizes to pre-warm at boot (comma-separated), e.g. "1,5" if some
+# callers override BEAM_SIZE
+WHISPER_WARMUP_BEAM_SIZES = [
+    int(b) for b in os.getenv("WHISPER_WARMUP_BEAM_SIZES", str(BEAM_SIZE)).split(",") if b.strip()
+]
+SAMPLE_RATE = 16000
+AUDIO_DECODE_WORKERS = int(os.getenv("AUDIO_DECODE_WORKERS", "4"))
+# Parallel CTranslate2 workers (CUDA streams), each fed by its own GPU worker
+# thread. Every extra worker costs roughly 1.2x the activation/KV-cache VRAM;
+# 4 fits medium.en comfortably on an 8 GB card.
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "4"))
+# Files of one /transcribe_batch request queued on the GPU at a time, so a
+# large batch neither holds all its audio in memory nor starves other callers
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", str(2 * WHISPER_NUM_WORKERS)))
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Use CTranslate2's FlashAttention kernels when the GPU supports them (Ampere+)
+WHISPER_FLASH_ATTENTION = os.getenv("WHISPER_FLASH_ATTENTION", "1") == "1"
+FLASH_ATTENTION = False
+# Re-warm the GPU after this many idle seconds (0 disables)
+WHISPER_KEEPALIVE_S = int(os.getenv("WHISPER_KEEPALIVE_S", "240"))
+# Real-time sessions keep the last REALTIME_BUFFER_S of audio; every
+# REALTIME_INTERVAL_S the newest REALTIME_WINDOW_S is re-transcribed
+REALTIME_BUFFER_S = int(os.getenv("REALTIME_BUFFER_S", "30"))
+REALTIME_WINDOW_S = int(os.getenv("REALTIME_WINDOW_S", "5"))
+REALTIME_INTERVAL_S = float(os.getenv("REALTIME_INTERVAL_S", "0.5"))
+# Seconds a request waits on the GPU queue (or between segments) before giving up
+TRANSCRIBE_TIMEOUT_S = float(os.getenv("TRANSCRIBE_TIMEOUT_S", "120"))
 CONFIG_DIR = Path("config")
 METRICS_DIR = Path("metrics")
 METRICS_DIR.mkdir(exist_ok=True)
+# Upper bound on a single Gemini call so a stalled request cannot pin a
+# server thread indefinitely
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+# Parsed Gemini replies kept in memory; 0 disables
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "1024"))
+# Save the cache to METRICS_DIR across restarts. Off by default: entries
+# hold extracted clinical field values in plaintext.
+GEMINI_CACHE_PERSIST = os.getenv("GEMINI_CACHE_PERSIST", "0") == "1"
 
 # --- Data Classes for Metrics ---
-@dataclass
+# Metric records are serialized by orjson's native dataclass support;
+# __slots__ makes that path faster and skips the asdict() copy entirely.
+@dataclass(slots=True)
 class TranscriptionMetric:
     id: str
     timestamp: datetime
@@ -40,110 +145,609 @@ class TranscriptionMetric:
     confidence_avg: float
     model_used: str
 
-@dataclass
+@dataclass(slots=True)
 class TemplateMetric:
     id: str
     timestamp: datetime
     template_key: str
-    template_source: str  # "static", "dynamic", "modified"
+    template_source: str  # "static", "dynamic", "modified", "cache"
     processing_time: float
     field_count: int
     low_confidence_count: int
     avg_confidence: float
     user_corrections: int = 0
 
+# Metric records are flat JSON objects of strings and numbers, so the summary
+# pulls just the fields it aggregates straight from the raw line bytes
+# instead of building a dict of every field.
+_METRIC_TIMESTAMP_RE = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+_METRIC_FIELD_RE = re.compile(rb'"(\w+)"\s*:\s*("(?:[^"\\]|\\.)*"|[-+0-9.eE]+)')
+# Summary field -> column dtype; missing numbers read as 0 and strings as ""
+_TRANSCRIPTION_SUMMARY_FIELDS = {b'processing_time': np.float64, b'confidence_avg': np.float64}
+_TEMPLATE_SUMMARY_FIELDS = {
+    b'template_key': object, b'template_source': object, b'processing_time': np.float64,
+    b'avg_confidence': np.float64, b'user_corrections': np.float64
+}
+
+@dataclass
+class MetricsView:
+    """Summary fields of the records in a window, one array per field"""
+    count: int
+    columns: Dict[str, np.ndarray]
+    
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
 class MetricsTracker:
-    """Track and analyze system performance metrics"""
+    """Track and analyze system performance metrics
+
+    Records are buffered in memory and appended to the JSONL logs in one
+    write per log by a background thread, every ``flush_interval_s`` or as
+    soon as ``max_buffered`` records are pending.
+    
+    Each log is split into daily segments (``transcriptions-YYYYMMDD.jsonl``);
+    segments from earlier days are compressed with zstd (gzip if zstandard
+    is not installed) at rollover, and summaries only open segments dated
+    on or after the cutoff day. Pre-rotation
+    ``transcriptions.jsonl``/``templates.jsonl`` files are still read.
+    """
     
-    def __init__(self, metrics_dir: Path):
+    def __init__(self, metrics_dir: Path, flush_interval_s: float = 0.25, max_buffered: int = 256):
         self.metrics_dir = metrics_dir
-        self.transcription_log = metrics_dir / "transcriptions.jsonl"
-        self.template_log = metrics_dir / "templates.jsonl"
+        self.flush_interval_s = flush_interval_s
+        self.max_buffered = max_buffered
+        
+        self._lock = threading.Lock()        # guards the buffers
+        self._write_lock = threading.Lock()  # serializes file writes and rotation
+        self._buf_trans = []
+        self._buf_tpl = []
+        self._fh_trans = None
+        self._fh_tpl = None
+        self._day = None
+        self._rotate(date.today())
+        self._wake = threading.Event()
+        
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
         
     def log_transcription(self, metric: TranscriptionMetric):
-        with open(self.transcription_log, 'a') as f:
-            f.write(json.dumps(asdict(metric), default=str) + '\n')
+        self._append(self._buf_trans, orjson.dumps(metric))
     
     def log_template_usage(self, metric: TemplateMetric):
-        with open(self.template_log, 'a') as f:
-            f.write(json.dumps(asdict(metric), default=str) + '\n')
+        self._append(self._buf_tpl, orjson.dumps(metric))
+    
+    def _append(self, buffer: List[bytes], line: bytes):
+        with self._lock:
+            buffer.append(line)
+            pending = len(buffer)
+        if pending >= self.max_buffered:
+            self._wake.set()
+    
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("Metrics flush failed: %s", e)
+    
+    def _rotate(self, day: date):
+        """Point both handles at day's segments and compress earlier plain segments"""
+        for fh in (self._fh_trans, self._fh_tpl):
+            if fh is not None:
+                fh.close()
+        self._fh_trans = open(self.metrics_dir / f"transcriptions-{day:%Y%m%d}.jsonl", 'ab', buffering=1 << 16)
+        self._fh_tpl = open(self.metrics_dir / f"templates-{day:%Y%m%d}.jsonl", 'ab', buffering=1 << 16)
+        self._day = day
+        
+        for path in self.metrics_dir.glob("*-*.jsonl"):
+            segment_day = self._segment_day(path)
+            if segment_day is None or segment_day >= day:
+                continue
+            try:
+                self._compress_segment(path)
+            except OSError as e:
+                logging.warning("Could not compress metrics segment %s: %s", path, e)
+    
+    @staticmethod
+    def _compress_segment(path: Path):
+        """Replace a closed segment with a .zst copy (.gz without zstandard)"""
+        suffix = ".zst" if zstandard is not None else ".gz"
+        tmp_path = path.with_name(path.name + suffix + ".tmp")
+        with open(path, 'rb') as src:
+            if zstandard is not None:
+                with open(tmp_path, 'wb') as dst:
+                    zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+            else:
+                with gzip.open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path.with_name(path.name + suffix))
+        path.unlink()
+    
+    @staticmethod
+    def _open_segment(path: Path):
+        """Open a plain, gzip or zstd segment for binary line iteration"""
+        if path.suffix == ".gz":
+            return gzip.open(path, 'rb')
+        if path.suffix == ".zst":
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+        return open(path, 'rb')
+    
+    @staticmethod
+    def _segment_day(path: Path) -> Optional[date]:
+        """Date embedded in a segment's name, or None for anything else"""
+        stem, _, suffix = path.name.partition(".")
+        if suffix not in ("jsonl", "jsonl.gz", "jsonl.zst"):
+            return None
+        try:
+            return datetime.strptime(stem.rpartition("-")[2], "%Y%m%d").date()
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def _cutoff_datetime(cutoff: float) -> datetime:
+        """Local datetime for cutoff, clamped to the epoch..now range datetime can represent"""
+        return datetime.fromtimestamp(min(max(cutoff, 0), datetime.now().timestamp()))
+    
+    def _segments(self, name: str, cutoff: float) -> List[Path]:
+        """Legacy log plus the daily segments that can hold records newer than cutoff"""
+        cutoff_day = self._cutoff_datetime(cutoff).date()
+        paths = [p for p in [self.metrics_dir / f"{name}.jsonl"] if p.exists()]
+        for path in sorted(self.metrics_dir.glob(f"{name}-*.jsonl*")):
+            segment_day = self._segment_day(path)
+            if segment_day is not None and segment_day >= cutoff_day:
+                paths.append(path)
+        return paths
+    
+    def flush(self):
+        """Write all buffered records to their logs"""
+        with self._write_lock:
+            today = date.today()
+            if today != self._day:
+                self._rotate(today)
+            with self._lock:
+                trans, self._buf_trans = self._buf_trans, []
+                tpl, self._buf_tpl = self._buf_tpl, []
+            for fh, batch in ((self._fh_trans, trans), (self._fh_tpl, tpl)):
+                if batch:
+                    fh.write(b'\n'.join(batch) + b'\n')
+                    fh.flush()
     
     def get_summary(self, days: int = 7) -> Dict:
         """Get performance summary for last N days"""
         cutoff = datetime.now().timestamp() - (days * 86400)
+        self.flush()
         
-        transcriptions = self._read_metrics(self.transcription_log, cutoff)
-        templates = self._read_metrics(self.template_log, cutoff)
+        transcriptions = self._read_metrics("transcriptions", cutoff, _TRANSCRIPTION_SUMMARY_FIELDS)
+        templates = self._read_metrics("templates", cutoff, _TEMPLATE_SUMMARY_FIELDS)
         
         return {
             "period_days": days,
             "transcription_stats": {
-                "total_count": len(transcriptions),
-                "avg_processing_time": self._avg([t['processing_time'] for t in transcriptions]),
-                "avg_confidence": self._avg([t['confidence_avg'] for t in transcriptions]),
+                "total_count": transcriptions.count,
+                "avg_processing_time": self._avg(transcriptions['processing_time']),
+                "avg_confidence": self._avg(transcriptions['confidence_avg']),
             },
             "template_stats": {
-                "total_count": len(templates),
-                "avg_processing_time": self._avg([t['processing_time'] for t in templates]),
-                "avg_confidence": self._avg([t['avg_confidence'] for t in templates]),
-                "dynamic_template_usage": sum(1 for t in templates if t['template_source'] == 'dynamic'),
-                "problematic_templates": self._identify_problematic(templates)
+                "total_count": templates.count,
+                "avg_processing_time": self._avg(templates['processing_time']),
+                "avg_confidence": self._avg(templates['avg_confidence']),
+                "dynamic_template_usage": int(np.count_nonzero(templates['template_source'] == 'dynamic')),
+                "problematic_templates": self._identify_problematic(
+                    templates['template_key'],
+                    templates['avg_confidence'],
+                    templates['user_corrections']
+                )
             }
         }
     
-    def _read_metrics(self, log_file: Path, cutoff: float) -> List[Dict]:
-        if not log_file.exists():
+    @staticmethod
+    def _timestamp_key(iso: bytes) -> bytes:
+        """Sortable YYYY-MM-DDHH:MM:SS[.ffffff] key for an ISO timestamp
+
+        Records written by orjson use a 'T' separator and older ones a
+        space, so the separator is dropped; comparing these keys orders
+        naive local timestamps without parsing them.
+        """
+        return iso[:10] + iso[11:]
+    
+    def _read_metrics(self, name: str, cutoff: float, fields: Dict[bytes, type]) -> MetricsView:
+        """Read records newer than cutoff straight into one column per requested field"""
+        cutoff_dt = self._cutoff_datetime(cutoff)
+        cutoff_key = self._timestamp_key(cutoff_dt.isoformat().encode())
+        cutoff_day = cutoff_dt.date()
+        defaults = [(field, "" if dtype is object else 0) for field, dtype in fields.items()]
+        columns = {field: [] for field in fields}
+        count = 0
+        for log_file in self._segments(name, cutoff):
+            # Only the legacy log and the segment for the cutoff day can hold
+            # older records; later segments are taken whole
+            segment_day = self._segment_day(log_file)
+            check_time = segment_day is None or segment_day <= cutoff_day
+            if log_file.suffix == ".zst" and zstandard is None:
+                logging.warning("Skipping %s: zstandard is not installed", log_file.name)
+                continue
+            with self._open_segment(log_file) as f:
+                for line in f:
+                    try:
+                        if check_time:
+                            ts_match = _METRIC_TIMESTAMP_RE.search(line)
+                            if self._timestamp_key(ts_match.group(1)) < cutoff_key:
+                                continue
+                        record = {
+                            key: orjson.loads(value)
+                            for key, value in _METRIC_FIELD_RE.findall(line)
+                            if key in fields
+                        }
+                    except:
+                        continue
+                    for field, default in defaults:
+                        columns[field].append(record.get(field, default))
+                    count += 1
+        return MetricsView(count, {
+            field.decode(): np.array(columns[field], dtype=dtype)
+            for field, dtype in fields.items()
+        })
+    
+    def _avg(self, values: np.ndarray) -> float:
+        return float(values.mean()) if values.size else 0.0
+    
+    def _identify_problematic(self, keys: np.ndarray, confidences: np.ndarray,
+                              corrections: np.ndarray) -> List[Dict]:
+        """Identify templates with low confidence or high correction rates"""
+        if not keys.size:
             return []
         
-        metrics = []
-        with open(log_file, 'r') as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    ts = datetime.fromisoformat(data['timestamp']).timestamp()
-                    if ts >= cutoff:
-                        metrics.append(data)
-                except:
-                    continue
-        return metrics
-    
-    def _avg(self, values: List[float]) -> float:
-        return sum(values) / len(values) if values else 0.0
-    
-    def _identify_problematic(self, templates: List[Dict]) -> List[Dict]:
-        """Identify templates with low confidence or high correction rates"""
-        template_groups = {}
-        for t in templates:
-            key = t['template_key']
-            if key not in template_groups:
-                template_groups[key] = []
-            template_groups[key].append(t)
+        # Group by template key in first-seen order, then average per group
+        unique_keys, first_seen, group_idx = np.unique(keys, return_index=True, return_inverse=True)
+        counts = np.bincount(group_idx)
+        avg_conf = np.bincount(group_idx, weights=confidences) / counts
+        avg_corrections = np.bincount(group_idx, weights=corrections) / counts
         
         problematic = []
-        for key, group in template_groups.items():
-            avg_conf = self._avg([t['avg_confidence'] for t in group])
-            avg_corrections = self._avg([t.get('user_corrections', 0) for t in group])
-            
-            if avg_conf < 0.6 or avg_corrections > 2:
+        for g in np.argsort(first_seen):
+            if avg_conf[g] < 0.6 or avg_corrections[g] > 2:
                 problematic.append({
-                    "template_key": key,
-                    "usage_count": len(group),
-                    "avg_confidence": round(avg_conf, 2),
-                    "avg_corrections": round(avg_corrections, 2),
+                    "template_key": unique_keys[g],
+                    "usage_count": int(counts[g]),
+                    "avg_confidence": round(float(avg_conf[g]), 2),
+                    "avg_corrections": round(float(avg_corrections[g]), 2),
                     "recommendation": "Consider template revision"
                 })
         
         return problematic
 
+_WHITESPACE_RE = re.compile(r'\s+')
+
+class GeminiResponseCache:
+    """LRU cache of parsed Gemini replies, keyed by a hash of the request inputs
+
+    Dictations are often resubmitted verbatim, and a hit skips the Gemini
+    round-trip entirely. When ``path`` is set, entries are saved there at
+    exit and reloaded on boot. A ``max_entries`` of 0 disables the cache.
+    """
+    
+    def __init__(self, path: Optional[Path], max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if max_entries > 0 and path is not None:
+            self._load()
+            atexit.register(self.save)
+    
+    @staticmethod
+    def key(endpoint: str, text: str, *verbatim: str) -> str:
+        """Hash an endpoint name, the dictated text and any further inputs
+
+        Only the dictation is case/whitespace-normalized; other parts such
+        as template text are hashed exactly, since placeholder names and
+        layout change the reply.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (endpoint, _WHITESPACE_RE.sub(" ", str(text)).strip().lower(), *verbatim):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    record = orjson.loads(line)
+                    self._entries[record["key"]] = record["value"]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            logging.info(f"Loaded {len(self._entries)} cached Gemini responses.")
+        except Exception as e:
+            logging.warning(f"Could not load Gemini response cache: {e}")
+    
+    def save(self):
+        """Write entries oldest-first so reloading preserves LRU order"""
+        with self._lock:
+            lines = [orjson.dumps({"key": k, "value": v}) for k, v in self._entries.items()]
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(line + b"\n" for line in lines))
+        os.replace(tmp_path, self.path)
+
 # --- Whisper Initialization ---
+def flash_attention_supported() -> bool:
+    """FlashAttention needs compute capability >= 8.0, where CTranslate2 also offers bfloat16"""
+    if not WHISPER_FLASH_ATTENTION or DEVICE != "cuda":
+        return False
+    try:
+        return "bfloat16" in ctranslate2.get_supported_compute_types("cuda")
+    except Exception:
+        return False
+
+def load_whisper_model() -> WhisperModel:
+    """Load Whisper, falling back to wider compute types if unsupported"""
+    global COMPUTE_TYPE, FLASH_ATTENTION
+    candidates = [COMPUTE_TYPE] + [c for c in COMPUTE_TYPE_FALLBACKS if c != COMPUTE_TYPE]
+    flash_options = [True, False] if flash_attention_supported() else [False]
+    last_error = None
+    for compute_type in candidates:
+        for flash_attention in flash_options:
+            try:
+                logging.info(
+                    f"Loading Whisper model '{MODEL_SIZE}' on device '{DEVICE}' "
+                    f"({compute_type}, flash_attention={flash_attention})..."
+                )
+                whisper_model = WhisperModel(
+                    MODEL_SIZE,
+                    device=DEVICE,
+                    compute_type=compute_type,
+                    num_workers=WHISPER_NUM_WORKERS,
+                    cpu_threads=WHISPER_CPU_THREADS,
+                    flash_attention=flash_attention
+                )
+                COMPUTE_TYPE = compute_type
+                FLASH_ATTENTION = flash_attention
+                return whisper_model
+            except Exception as e:
+                logging.warning(f"Compute type '{compute_type}' (flash_attention={flash_attention}) unavailable: {e}")
+                last_error = e
+    raise last_error
+
+def _calibration_logprob(pipeline: BatchedInferencePipeline, audio) -> Optional[float]:
+    """Mean avg_logprob of the clip through the same batched path that serves requests"""
+    segments, _ = pipeline.transcribe(audio, batch_size=GPU_BATCH_SIZE, **TRANSCRIBE_OPTIONS)
+    logprobs = [seg.avg_logprob for seg in segments]
+    return float(np.mean(logprobs)) if logprobs else None
+
+def load_calibration() -> Optional[tuple]:
+    """(audio, float16 avg_logprob) for the calibration clip, or None if the check is off
+
+    A missing baseline is computed once per model and clip with a temporary
+    float16 model and stored in METRICS_DIR. This runs before the int8
+    model is loaded, so the two never share VRAM.
+    """
+    if not WHISPER_CALIBRATION_AUDIO or not COMPUTE_TYPE.startswith("int8"):
+        return None
+    try:
+        clip_bytes = Path(WHISPER_CALIBRATION_AUDIO).read_bytes()
+        audio = decode_audio(io.BytesIO(clip_bytes), sampling_rate=SAMPLE_RATE)
+        baseline_file = METRICS_DIR / "calibration_baselines.json"
+        baselines = orjson.loads(baseline_file.read_bytes()) if baseline_file.exists() else {}
+        baseline_key = f"{MODEL_SIZE}:{hashlib.sha1(clip_bytes).hexdigest()}"
+        
+        baseline = baselines.get(baseline_key)
+        if baseline is None:
+            logging.info("Computing float16 calibration baseline...")
+            reference = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type="float16", num_workers=1)
+            baseline = _calibration_logprob(BatchedInferencePipeline(model=reference), audio)
+            del reference
+            if baseline is None:
+                logging.warning("Calibration clip produced no speech; skipping quantization check")
+                return None
+            baselines[baseline_key] = baseline
+            baseline_file.write_bytes(orjson.dumps(baselines))
+        return audio, baseline
+    except Exception as e:
+        logging.warning(f"Quantization self-test unavailable: {e}")
+        return None
+
+def quantization_drifted(pipeline: BatchedInferencePipeline, calibration: tuple) -> bool:
+    """Compare the loaded int8 model's avg_logprob on the calibration clip to float16"""
+    if not COMPUTE_TYPE.startswith("int8"):
+        return False  # load_whisper_model already fell back to a wider type
+    audio, baseline = calibration
+    try:
+        quantized = _calibration_logprob(pipeline, audio)
+    except Exception as e:
+        logging.warning(f"Quantization self-test failed: {e}")
+        return False
+    
+    drift = baseline - quantized if quantized is not None else float("inf")
+    logging.info(f"{COMPUTE_TYPE} avg_logprob drift vs float16: {drift:.3f}")
+    return drift > WHISPER_CALIBRATION_MAX_DRIFT
+
+# One second of silence; transcribed with VAD off so the encoder still runs
+_WARMUP_AUDIO = np.zeros(SAMPLE_RATE, dtype=np.float32)
+# A full GPU batch of silent 30s windows, so workspaces grow to their
+# production size; without VAD the windows have to be given explicitly
+_WARMUP_BATCH_AUDIO = np.zeros(GPU_BATCH_SIZE * 30 * SAMPLE_RATE, dtype=np.float32)
+_WARMUP_CLIPS = [{"start": i * 30, "end": (i + 1) * 30} for i in range(GPU_BATCH_SIZE)]
+
 try:
-    logging.info(f"Loading Whisper model '{MODEL_SIZE}' on device '{DEVICE}'...")
-    model = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE)
+    calibration = load_calibration()
+    model = load_whisper_model()
+    batched_model = BatchedInferencePipeline(model=model)
+    if calibration is not None and quantization_drifted(batched_model, calibration):
+        logging.warning(f"{COMPUTE_TYPE} drifted beyond {WHISPER_CALIBRATION_MAX_DRIFT}; reloading as float16")
+        del batched_model, model
+        COMPUTE_TYPE = "float16"
+        model = load_whisper_model()
+        batched_model = BatchedInferencePipeline(model=model)
     logging.info("Whisper model loaded successfully.")
 except Exception as e:
     logging.error(f"Failed to load Whisper model: {e}")
     exit(1)
 
+# --- GPU Worker ---
+# All Whisper calls go through WHISPER_NUM_WORKERS worker threads (one per
+# CTranslate2 worker) so concurrent requests queue up instead of contending
+# for the CUDA context. Each job gets its own
+# result queue: the worker puts `info`, then each segment as it is decoded,
+# then None (or an exception in place of any of these). A caller that times
+# out or stops reading sets the job's cancel event, and the worker drops it
+# rather than spending GPU time on a result nobody will read.
+transcription_queue = Queue()
+last_gpu_activity = time.time()
+
+def _gpu_worker():
+    global last_gpu_activity
+    while True:
+        audio, options, results, cancelled = transcription_queue.get()
+        try:
+            if cancelled.is_set():
+                continue
+            segments, info = batched_model.transcribe(
+                audio, batch_size=GPU_BATCH_SIZE, **{**TRANSCRIBE_OPTIONS, **options}
+            )
+            results.put(info)
+            for seg in segments:
+                if cancelled.is_set():
+                    break
+                results.put(seg)
+            results.put(None)
+        except Exception as e:
+            results.put(e)
+        finally:
+            last_gpu_activity = time.time()
+            transcription_queue.task_done()
+
+def _next_result(results: Queue, cancelled: threading.Event):
+    try:
+        item = results.get(timeout=TRANSCRIBE_TIMEOUT_S)
+    except Empty:
+        cancelled.set()
+        raise TimeoutError(f"No transcription result within {TRANSCRIBE_TIMEOUT_S:.0f}s")
+    if isinstance(item, Exception):
+        cancelled.set()
+        raise item
+    return item
+
+def _iter_results(results: Queue, cancelled: threading.Event):
+    try:
+        while True:
+            item = _next_result(results, cancelled)
+            if item is None:
+                return
+            yield item
+    finally:
+        # Covers callers that stop early, e.g. a disconnected stream
+        cancelled.set()
+
+def enqueue_transcription(audio, **options) -> tuple:
+    """Queue audio for the GPU workers without waiting; pass the job to collect_transcription"""
+    results = Queue()
+    cancelled = threading.Event()
+    transcription_queue.put((audio, options, results, cancelled))
+    return results, cancelled
+
+def collect_transcription(job: tuple):
+    """Wait for a queued job's info; returns (segments, info) like model.transcribe
+
+    Raises TimeoutError if the worker produces nothing for
+    TRANSCRIBE_TIMEOUT_S, whether the job is still queued or mid-decode.
+    """
+    results, cancelled = job
+    info = _next_result(results, cancelled)
+    return _iter_results(results, cancelled), info
+
+def submit_transcription(audio, **options):
+    """Queue audio and wait for it; keyword arguments override TRANSCRIBE_OPTIONS for this job only"""
+    return collect_transcription(enqueue_transcription(audio, **options))
+
+def _gpu_keepalive():
+    """Re-run the warm-up pass whenever the GPU has sat idle for WHISPER_KEEPALIVE_S"""
+    while True:
+        idle = time.time() - last_gpu_activity
+        if idle < WHISPER_KEEPALIVE_S:
+            time.sleep(WHISPER_KEEPALIVE_S - idle)
+            continue
+        try:
+            segments, _ = submit_transcription(_WARMUP_AUDIO, vad_filter=False)
+            list(segments)
+        except Exception as e:
+            logging.warning(f"GPU keepalive pass failed: {e}")
+
+for worker_idx in range(WHISPER_NUM_WORKERS):
+    threading.Thread(target=_gpu_worker, name=f"gpu-worker-{worker_idx}", daemon=True).start()
+
+def warm_up_workers():
+    """Run a full-batch pass per warm-up beam size before serving requests
+
+    Kernel selection and VRAM pool growth then happen at boot rather than
+    on the first requests. One job per GPU worker is queued at once so
+    every CTranslate2 worker gets warmed, not just the first to pick up.
+    """
+    start_time = time.time()
+    for beam_size in WHISPER_WARMUP_BEAM_SIZES:
+        jobs = [
+            enqueue_transcription(
+                _WARMUP_BATCH_AUDIO, beam_size=beam_size, vad_filter=False, clip_timestamps=_WARMUP_CLIPS
+            )
+            for _ in range(WHISPER_NUM_WORKERS)
+        ]
+        for job in jobs:
+            segments, _ = collect_transcription(job)
+            list(segments)
+    logging.info(f"Whisper warm-up passes took {time.time() - start_time:.2f}s")
+
+try:
+    warm_up_workers()
+except Exception as e:
+    logging.warning(f"Whisper warm-up failed: {e}")
+if WHISPER_KEEPALIVE_S > 0:
+    threading.Thread(target=_gpu_keepalive, name="gpu-keepalive", daemon=True).start()
+
+# --- Audio Decoding ---
+# Uploads are decoded to 16 kHz float32 PCM on a CPU pool so the GPU worker
+# only ever receives ready-to-use arrays. The PCM itself never goes to the
+# GPU: faster-whisper computes log-mel features on the CPU and CTranslate2
+# owns the device copy of those, so pinned host buffers would not help here.
+decode_pool = ThreadPoolExecutor(max_workers=AUDIO_DECODE_WORKERS, thread_name_prefix="audio-decode")
+
+def decode_to_float32(data: bytes):
+    """Decode an upload to 16 kHz mono float32 PCM
+
+    16 kHz WAV/FLAC, which is what the dictation clients record, is read
+    straight into an array by libsndfile when soundfile is installed; other
+    formats and sample rates go through PyAV's decoder and resampler. Only
+    the header is parsed before that choice, so nothing is decoded twice.
+    """
+    if soundfile is not None:
+        try:
+            with soundfile.SoundFile(io.BytesIO(data)) as sf:
+                audio = sf.read(dtype='float32') if sf.samplerate == SAMPLE_RATE else None
+        except Exception:
+            audio = None
+        if audio is not None:
+            return audio if audio.ndim == 1 else audio.mean(axis=1, dtype=np.float32)
+    return decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+
 # --- Gemini 2.5 Initialization ---
 try:
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -161,100 +765,559 @@ except Exception as e:
 
 # --- Load Static Macro Templates (for fallback/reference) ---
 try:
-    with open(CONFIG_DIR / "macros.json", "r") as f:
-        STATIC_TEMPLATES = json.load(f)
+    STATIC_TEMPLATES = orjson.loads((CONFIG_DIR / "macros.json").read_bytes())
     logging.info(f"Loaded {len(STATIC_TEMPLATES)} static templates.")
 except Exception as e:
     logging.error(f"Could not load macro templates: {e}")
     STATIC_TEMPLATES = {}
 
+# --- Prompt Templates ---
+# Prompts are assembled by concatenating request text between constant
+# pieces built once at import. process_note prompts are PREFIX + raw_text +
+# a per-template suffix (see _template_meta).
+SELECT_PROMPT_PREFIX = f"""You are a medical documentation expert specializing in vascular surgery.
+
+TASK: Analyze the following dictated medical text and determine the most appropriate procedure template.
+
+AVAILABLE TEMPLATES:
+{json.dumps(list(STATIC_TEMPLATES.keys()), indent=2)}
+
+DICTATED TEXT:
+---
+"""
+
+SELECT_PROMPT_SUFFIX = """
+---
+
+INSTRUCTIONS:
+1. Identify the primary procedure being described
+2. Select the most appropriate template from the list
+3. Provide confidence score (0.0-1.0)
+4. Suggest if a custom/dynamic template would be better
+
+OUTPUT FORMAT (JSON only):
+{
+  "recommended_template": "template_key",
+  "confidence": 0.95,
+  "reasoning": "Brief explanation",
+  "requires_dynamic_template": false,
+  "procedure_type": "Procedure name"
+}
+
+Respond ONLY with valid JSON."""
+
+DYNAMIC_PROMPT_PREFIX = """You are an expert medical documentation specialist.
+
+TASK: Create a professional medical procedure template based on the dictated content.
+
+DICTATED TEXT:
+---
+"""
+
+DYNAMIC_PROMPT_MIDDLE = """
+---
+
+PROCEDURE TYPE: """
+
+DYNAMIC_PROMPT_SUFFIX = """
+
+INSTRUCTIONS:
+1. Analyze the dictated content structure
+2. Create a professional template with appropriate sections
+3. Use placeholders {field_name} for variable content
+4. Include standard sections: Date, Diagnoses, Procedures, Complications, etc.
+5. Match the style and detail level of the dictation
+
+REFERENCE FORMAT:
+Procedure Date: {date}
+
+Preoperative Diagnosis:
+1. {preop_dx}
+
+Postoperative Diagnosis:
+1. {postop_dx}
+
+Procedure Performed:
+1. {procedure_name}
+
+[Additional relevant sections based on content]
+
+OUTPUT: Return ONLY the template text with placeholders. No JSON, no explanation."""
+
+NOTE_PROMPT_PREFIX = """You are an expert medical scribe with advanced entity extraction capabilities using Gemini 2.5.
+
+TASK: Extract structured information from dictated medical text and fill template placeholders with high accuracy.
+
+DICTATED TEXT:
+---
+"""
+
+NOTE_PROMPT_SUFFIX = """
+---
+
+TEMPLATE TO FILL:
+---
+{template_text}
+---
+
+INSTRUCTIONS:
+1. Identify all placeholders in the template (format: {{field_name}})
+2. Extract corresponding information from the dictated text
+3. Use advanced reasoning to infer missing information when appropriate
+4. Assign confidence scores (0.0-1.0):
+   - 1.0: Explicitly stated, unambiguous
+   - 0.8-0.9: Clearly implied or paraphrased  
+   - 0.5-0.7: Inferred from medical context
+   - 0.0-0.4: Uncertain or not found
+5. Maintain medical terminology accuracy
+6. For dates, use format: MM/DD/YYYY
+
+OUTPUT FORMAT (JSON only, no markdown):
+{{
+  "field_name": {{
+    "value": "extracted text",
+    "confidence": 0.95,
+    "source": "explicit|inferred|contextual"
+  }}
+}}
+
+Respond ONLY with valid JSON."""
+
+# --- Template Fields ---
+# Placeholder names, fallback-extractor regexes and the filled-in prompt
+# suffix are derived once per distinct template text rather than on every
+# request; static templates are parsed at boot.
+def compile_field_prefilter(patterns: List[FieldPattern]):
+    """Single-pass matcher over every field pattern: hyperscan if installed, else an RE2 set"""
+    if not patterns:
+        return None
+    try:
+        if hyperscan is not None:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=[pattern.pattern.encode() for _, pattern in patterns],
+                ids=list(range(len(patterns))),
+                flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(patterns)
+            )
+            return database
+        if re2 is not None:
+            options = re2.Options()
+            options.case_sensitive = False
+            field_set = re2.Set.SearchSet(options)
+            for _, pattern in patterns:
+                field_set.Add(pattern.pattern)
+            field_set.Compile()
+            return field_set
+    except Exception as e:
+        logging.warning(f"Could not compile field prefilter: {e}")
+    return None
+
+@dataclass(frozen=True)
+class TemplateMeta:
+    """Everything process_note derives from a template's text"""
+    fields: tuple
+    patterns: List[FieldPattern]
+    prefilter: object
+    prompt_suffix: str
+
+@lru_cache(maxsize=256)
+def _template_meta(template_text: str) -> TemplateMeta:
+    """Parse a template once; repeat dynamic/modified templates hit the cache too"""
+    fields = tuple(extract_fields(template_text))
+    patterns = compile_field_patterns(list(fields))
+    return TemplateMeta(
+        fields=fields,
+        patterns=patterns,
+        prefilter=compile_field_prefilter(patterns),
+        prompt_suffix=NOTE_PROMPT_SUFFIX.format(template_text=template_text)
+    )
+
+# Warms the cache for every static template at boot
+TEMPLATE_FIELDS = {key: list(_template_meta(template).fields) for key, template in STATIC_TEMPLATES.items()}
+# Hyperscan scratch space is per-database and not thread-safe
+_hyperscan_lock = threading.Lock()
+
+def _prefilter_fields(prefilter, text: str) -> Optional[Dict[int, Optional[int]]]:
+    """Map each matching pattern id to its leftmost start offset
+
+    RE2 sets only report which patterns matched, so their offsets are None.
+    Returns None when the prefilter cannot be used for this text.
+    """
+    # Neither engine agrees with re on non-ASCII text: hyperscan offsets are
+    # byte offsets, and RE2's \s and \b miss Unicode spaces such as NBSP
+    if not text.isascii():
+        return None
+    if hyperscan is not None and isinstance(prefilter, hyperscan.Database):
+        starts = {}
+        def on_match(pattern_id, start, end, flags, context):
+            if start < starts.get(pattern_id, end + 1):
+                starts[pattern_id] = start
+        with _hyperscan_lock:
+            prefilter.scan(text.encode(), match_event_handler=on_match)
+        return starts
+    return dict.fromkeys(prefilter.Match(text) or ())
+
+def parse_gemini_fields(text: str) -> tuple:
+    """Parse Gemini's field JSON, returning (fields, "gemini"|"repaired") or (None, None)
+
+    Truncated or otherwise malformed replies are repaired and every field
+    with a numeric confidence is kept, so only replies with nothing
+    salvageable fall through to the regex extractor.
+    """
+    cleaned = strip_code_fences(text)
+    try:
+        return orjson.loads(cleaned), "gemini"
+    except orjson.JSONDecodeError:
+        pass
+    
+    repaired = repair_json(cleaned, return_objects=True)
+    if not isinstance(repaired, dict):
+        return None, None
+    fields = {}
+    for field, value in repaired.items():
+        if not isinstance(value, dict):
+            continue
+        try:
+            value["confidence"] = float(value["confidence"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        fields[field] = value
+    return (fields, "repaired") if fields else (None, None)
+
+def _fallback_extraction(text: str, meta: TemplateMeta) -> Dict[str, FieldValue]:
+    """Regex-based field extraction used when Gemini's reply cannot be parsed"""
+    prefilter = meta.prefilter
+    hits = _prefilter_fields(prefilter, text) if prefilter is not None else None
+    
+    return match_fields(text, meta.patterns, hits)
+
+# --- Pre-serialized Responses ---
+# Templates are immutable after boot, so their listing endpoints are
+# serialized once and served with an ETag for client-side caching.
+def _with_etag(body: bytes) -> tuple:
+    return body, hashlib.sha1(body).hexdigest()
+
+LIST_TEMPLATES_BODY = _with_etag(orjson.dumps({
+    "templates": list(STATIC_TEMPLATES),
+    "count": len(STATIC_TEMPLATES)
+}))
+VALIDATE_MACRO_BODIES = {
+    key: _with_etag(orjson.dumps({
+        "macro_key": key,
+        "fields": TEMPLATE_FIELDS[key],
+        "field_count": len(TEMPLATE_FIELDS[key]),
+        "template_length": len(STATIC_TEMPLATES[key])
+    }))
+    for key in STATIC_TEMPLATES
+}
+# Model, compute type and Gemini availability are settled by this point.
+# Load-balancer probes hit this often and never revalidate, so no ETag.
+HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "version": "7.0",
+    "whisper_model": MODEL_SIZE,
+    "device": DEVICE,
+    "compute_type": COMPUTE_TYPE,
+    "flash_attention": FLASH_ATTENTION,
+    "gemini_model": "gemini-2.0-flash-exp",
+    "gemini_enabled": gemini_model is not None,
+    "static_templates": len(STATIC_TEMPLATES),
+    "features": [
+        "dynamic_templates",
+        "batch_processing",
+        "realtime_transcription",
+        "quality_metrics",
+        "auto_template_selection"
+    ]
+})
+
 # Initialize metrics tracker
 metrics_tracker = MetricsTracker(METRICS_DIR)
+gemini_cache = GeminiResponseCache(
+    METRICS_DIR / "gemini_cache.jsonl" if GEMINI_CACHE_PERSIST else None,
+    GEMINI_CACHE_SIZE
+)
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Real OS threads (not eventlet/gevent greenlets) so the GPU worker and
+# decode pool run alongside request handlers; served by gunicorn's gthread
+# worker in production (see Dockerfile).
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+
+def generate_json_text(prompt: str) -> str:
+    """Stream a Gemini reply and stop reading once the top-level JSON object closes
+
+    Anything after the closing brace (a trailing fence, commentary) is never
+    waited for. If no complete object arrives, the full reply is returned.
+    """
+    parts = []
+    scanner = JsonObjectScanner()
+    response = gemini_model.generate_content(
+        prompt, stream=True, request_options={"timeout": GEMINI_TIMEOUT_S}
+    )
+    for chunk in response:
+        text = chunk.text
+        end = scanner.feed(text)
+        if end >= 0:
+            parts.append(text[:end])
+            return "".join(parts)
+        parts.append(text)
+    return "".join(parts)
+
+def orjson_response(payload, status: int = 200) -> Response:
+    """Build a JSON response, serialized with orjson"""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+def cached_json_response(cached: tuple) -> Response:
+    """Serve a pre-serialized (body, etag) pair, answering 304 on If-None-Match"""
+    body, etag = cached
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# --- Real-time Sessions ---
+# Socket.IO clients stream 16 kHz mono PCM16 chunks into a fixed-size ring
+# buffer per session. A single background task periodically transcribes
+# the tail of every session that received new audio, so chunk handlers
+# never touch the GPU and per-session memory stays bounded.
+class RealtimeSession:
+    """Ring buffer of a client's most recent float32 audio"""
+    
+    def __init__(self, capacity: int):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.write_idx = 0
+        self.total_written = 0      # samples since the last final pass
+        self.transcribed_upto = 0   # total_written at the last partial pass
+        self.final_requested = False
+        self.lock = threading.Lock()
+    
+    def write(self, samples: np.ndarray, is_final: bool = False):
+        capacity = self.buffer.size
+        with self.lock:
+            self.total_written += samples.size
+            samples = samples[-capacity:]
+            first = min(samples.size, capacity - self.write_idx)
+            self.buffer[self.write_idx:self.write_idx + first] = samples[:first]
+            self.buffer[:samples.size - first] = samples[first:]
+            self.write_idx = (self.write_idx + samples.size) % capacity
+            self.final_requested |= is_final
+    
+    def next_window(self, window_samples: int) -> tuple:
+        """Return (audio, is_final) for the next pass, or (None, False) if nothing is new
+
+        Partial passes cover the last window_samples; the final pass covers
+        everything still buffered and then empties the session.
+        """
+        with self.lock:
+            is_final = self.final_requested
+            if not is_final and self.total_written == self.transcribed_upto:
+                return None, False
+            
+            capacity = self.buffer.size
+            n = min(self.total_written if is_final else window_samples, self.total_written, capacity)
+            start = (self.write_idx - n) % capacity
+            if start + n <= capacity:
+                audio = self.buffer[start:start + n].copy()
+            else:
+                audio = np.concatenate((self.buffer[start:], self.buffer[:self.write_idx]))
+            
+            if is_final:
+                self.write_idx = self.total_written = self.transcribed_upto = 0
+                self.final_requested = False
+            else:
+                self.transcribed_upto = self.total_written
+            return audio, is_final
 
-# Real-time transcription queue
-realtime_sessions = {}
+realtime_sessions: Dict[str, RealtimeSession] = {}
+
+def _realtime_flusher():
+    """Transcribe each session's newest audio every REALTIME_INTERVAL_S"""
+    window_samples = REALTIME_WINDOW_S * SAMPLE_RATE
+    while True:
+        socketio.sleep(REALTIME_INTERVAL_S)
+        
+        # Queue every session first so the GPU workers share the pass
+        jobs = []
+        for session_id, session in list(realtime_sessions.items()):
+            audio, is_final = session.next_window(window_samples)
+            if audio is not None and audio.size:
+                jobs.append((session_id, is_final, enqueue_transcription(audio)))
+        
+        for session_id, is_final, job in jobs:
+            try:
+                segments, _ = collect_transcription(job)
+                socketio.emit('transcription_chunk', {
+                    'text': "".join(seg.text for seg in segments).strip(),
+                    'timestamp': time.time(),
+                    'is_final': is_final
+                }, to=session_id)
+            except Exception as e:
+                logging.error("Real-time transcription error: %s", e)
+                socketio.emit('error', {'message': str(e)}, to=session_id)
+
+socketio.start_background_task(_realtime_flusher)
 
 @app.route("/")
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "version": "7.0",
-        "whisper_model": MODEL_SIZE,
-        "device": DEVICE,
-        "gemini_model": "gemini-2.0-flash-exp",
-        "gemini_enabled": gemini_model is not None,
-        "static_templates": len(STATIC_TEMPLATES),
-        "features": [
-            "dynamic_templates",
-            "batch_processing",
-            "realtime_transcription",
-            "quality_metrics",
-            "auto_template_selection"
-        ]
-    })
+    return Response(HEALTH_BODY, mimetype="application/json")
+
+def _log_transcription(transcription_id: str, info, duration: float,
+                       word_count: int, avg_confidence: float):
+    metric = TranscriptionMetric(
+        id=transcription_id,
+        timestamp=datetime.now(),
+        audio_duration=info.duration,
+        processing_time=duration,
+        word_count=word_count,
+        confidence_avg=avg_confidence,
+        model_used=MODEL_SIZE
+    )
+    metrics_tracker.log_transcription(metric)
+    logging.info("[%s] Transcription complete in %.2fs (%d words)", transcription_id, duration, word_count)
+
+def _stream_transcription(transcription_id: str, segments, info, start_time: float):
+    """Yield one NDJSON line per segment as Whisper decodes it, then a summary line"""
+    text_buf = io.StringIO()
+    confidence_sum = 0.0
+    segment_count = 0
+    try:
+        for seg in segments:
+            confidence = getattr(seg, 'avg_logprob', 0.0)
+            if segment_count:
+                text_buf.write(" ")
+            text_buf.write(seg.text)
+            confidence_sum += confidence
+            segment_count += 1
+            yield orjson.dumps({
+                "text": seg.text,
+                "start": seg.start,
+                "end": seg.end,
+                "confidence": confidence
+            }) + b"\n"
+    except Exception as e:
+        logging.error("[%s] Transcription error: %s", transcription_id, e, exc_info=True)
+        yield orjson.dumps({"id": transcription_id, "error": "Failed to process audio"}) + b"\n"
+        return
+
+    transcribed_text = text_buf.getvalue().strip()
+    duration = time.time() - start_time
+    word_count = len(transcribed_text.split())
+    avg_confidence = confidence_sum / segment_count if segment_count else 0.0
+    _log_transcription(transcription_id, info, duration, word_count, avg_confidence)
+
+    yield orjson.dumps({
+        "id": transcription_id,
+        "text": transcribed_text,
+        "language": info.language,
+        "duration": info.duration,
+        "processing_time": duration,
+        "word_count": word_count,
+        "avg_confidence": avg_confidence,
+        "final": True
+    }) + b"\n"
 
 @app.route("/transcribe", methods=["POST"])
 def transcribe():
-    """Transcribe audio using Whisper"""
+    """Transcribe audio using Whisper
+
+    Pass ``?stream=true`` to receive segments as NDJSON while decoding is
+    still in progress; the last line carries the aggregate result. Pass
+    ``?segments=false`` to leave per-segment timing out of the response.
+    """
     if "file" not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
+        return orjson_response({"error": "No audio file provided"}, 400)
     
     file = request.files["file"]
     start_time = time.time()
     transcription_id = str(uuid.uuid4())
+    stream = request.args.get("stream", "false").lower() in ("1", "true", "yes")
+    include_segments = request.args.get("segments", "true").lower() not in ("0", "false", "no")
     
     try:
-        logging.info(f"[{transcription_id}] Received audio file, starting transcription...")
-        segments, info = model.transcribe(file, beam_size=5)
+        logging.info("[%s] Received audio file, starting transcription...", transcription_id)
+        audio = decode_pool.submit(decode_to_float32, file.read()).result()
+        segments, info = submit_transcription(audio)
+        
+        if stream:
+            return Response(
+                stream_with_context(_stream_transcription(transcription_id, segments, info, start_time)),
+                mimetype="application/x-ndjson"
+            )
         
         # Collect segments with timing and confidence
         segment_list = []
-        confidences = []
+        text_buf = io.StringIO()
+        confidence_sum = 0.0
+        segment_count = 0
         for seg in segments:
-            segment_list.append({
-                "text": seg.text,
-                "start": seg.start,
-                "end": seg.end,
-                "confidence": getattr(seg, 'avg_logprob', 0.0)
-            })
-            confidences.append(segment_list[-1]["confidence"])
+            confidence = getattr(seg, 'avg_logprob', 0.0)
+            if include_segments:
+                segment_list.append({
+                    "text": seg.text,
+                    "start": seg.start,
+                    "end": seg.end,
+                    "confidence": confidence
+                })
+            if segment_count:
+                text_buf.write(" ")
+            text_buf.write(seg.text)
+            confidence_sum += confidence
+            segment_count += 1
         
-        transcribed_text = " ".join([seg["text"] for seg in segment_list]).strip()
+        transcribed_text = text_buf.getvalue().strip()
         duration = time.time() - start_time
         word_count = len(transcribed_text.split())
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        avg_confidence = confidence_sum / segment_count if segment_count else 0.0
         
-        # Log metrics
-        metric = TranscriptionMetric(
-            id=transcription_id,
-            timestamp=datetime.now(),
-            audio_duration=info.duration,
-            processing_time=duration,
-            word_count=word_count,
-            confidence_avg=avg_confidence,
-            model_used=MODEL_SIZE
-        )
-        metrics_tracker.log_transcription(metric)
+        _log_transcription(transcription_id, info, duration, word_count, avg_confidence)
         
-        logging.info(f"[{transcription_id}] Transcription complete in {duration:.2f}s")
-        
-        return jsonify({
+        result = {
             "id": transcription_id,
             "text": transcribed_text,
-            "segments": segment_list,
             "language": info.language,
             "duration": info.duration,
             "processing_time": duration,
             "word_count": word_count,
             "avg_confidence": avg_confidence
-        })
+        }
+        if include_segments:
+            result["segments"] = segment_list
+        return orjson_response(result)
+    except TimeoutError as e:
+        logging.error("[%s] Transcription timed out: %s", transcription_id, e)
+        return orjson_response({"error": "Transcription queue is busy, please retry"}, 503)
+    except Exception as e:
+        logging.error("[%s] Transcription error: %s", transcription_id, e, exc_info=True)
+        return orjson_response({"error": "Failed to process audio"}, 500)
+
+def _decode_and_enqueue(data: bytes) -> tuple:
+    return enqueue_transcription(decode_to_float32(data))
+
+def _collect_batch_file(batch_id: str, total: int, idx: int, file, pending: Future) -> Dict:
+    """Wait for one /transcribe_batch file's decode and transcription and build its result entry"""
+    try:
+        logging.info("[Batch %s] Processing file %d/%d", batch_id, idx + 1, total)
+        segments, info = collect_transcription(pending.result())
+        
+        # Batch results only carry the text, so no per-segment dicts are built
+        transcribed_text = " ".join(seg.text for seg in segments).strip()
+        
+        return {
+            "file_index": idx,
+            "filename": file.filename,
+            "text": transcribed_text,
+            "duration": info.duration,
+            "status": "success"
+        }
     except Exception as e:
-        logging.error(f"[{transcription_id}] Transcription error: {e}", exc_info=True)
-        return jsonify({"error": "Failed to process audio"}), 500
+        logging.error("[Batch %s] Error on file %d: %s", batch_id, idx, e)
+        return {
+            "file_index": idx,
+            "filename": file.filename,
+            "status": "error",
+            "error": str(e)
+        }
 
 @app.route("/transcribe_batch", methods=["POST"])
 def transcribe_batch():
@@ -262,45 +1325,26 @@ def transcribe_batch():
     files = request.files.getlist("files")
     
     if not files:
-        return jsonify({"error": "No audio files provided"}), 400
+        return orjson_response({"error": "No audio files provided"}, 400)
     
     batch_id = str(uuid.uuid4())
     results = []
     
+    # Uploads are decoded in parallel on the CPU pool, and each decode task
+    # queues its own GPU job the moment it finishes, so decoding overlaps
+    # inference. At most BATCH_MAX_IN_FLIGHT files are read, decoding or
+    # queued at once; the oldest is collected before the next is read.
+    in_flight = deque()
     for idx, file in enumerate(files):
-        try:
-            logging.info(f"[Batch {batch_id}] Processing file {idx+1}/{len(files)}")
-            segments, info = model.transcribe(file, beam_size=5)
-            
-            segment_list = []
-            for seg in segments:
-                segment_list.append({
-                    "text": seg.text,
-                    "start": seg.start,
-                    "end": seg.end
-                })
-            
-            transcribed_text = " ".join([seg["text"] for seg in segment_list]).strip()
-            
-            results.append({
-                "file_index": idx,
-                "filename": file.filename,
-                "text": transcribed_text,
-                "duration": info.duration,
-                "status": "success"
-            })
-        except Exception as e:
-            logging.error(f"[Batch {batch_id}] Error on file {idx}: {e}")
-            results.append({
-                "file_index": idx,
-                "filename": file.filename,
-                "status": "error",
-                "error": str(e)
-            })
+        in_flight.append((idx, file, decode_pool.submit(_decode_and_enqueue, file.read())))
+        if len(in_flight) >= BATCH_MAX_IN_FLIGHT:
+            results.append(_collect_batch_file(batch_id, len(files), *in_flight.popleft()))
+    while in_flight:
+        results.append(_collect_batch_file(batch_id, len(files), *in_flight.popleft()))
     
     successful = sum(1 for r in results if r["status"] == "success")
     
-    return jsonify({
+    return orjson_response({
         "batch_id": batch_id,
         "total_files": len(files),
         "successful": successful,
@@ -312,135 +1356,70 @@ def transcribe_batch():
 def select_template():
     """AI-powered template selection"""
     if not gemini_model:
-        return jsonify({"error": "Gemini is not configured"}), 500
+        return orjson_response({"error": "Gemini is not configured"}, 500)
     
     data = request.get_json()
     if not data or "text" not in data:
-        return jsonify({"error": "Missing 'text' field"}), 400
+        return orjson_response({"error": "Missing 'text' field"}, 400)
     
     raw_text = data["text"]
     
-    prompt = f"""You are a medical documentation expert specializing in vascular surgery.
-
-TASK: Analyze the following dictated medical text and determine the most appropriate procedure template.
-
-AVAILABLE TEMPLATES:
-{json.dumps(list(STATIC_TEMPLATES.keys()), indent=2)}
-
-DICTATED TEXT:
----
-{raw_text}
----
-
-INSTRUCTIONS:
-1. Identify the primary procedure being described
-2. Select the most appropriate template from the list
-3. Provide confidence score (0.0-1.0)
-4. Suggest if a custom/dynamic template would be better
-
-OUTPUT FORMAT (JSON only):
-{{
-  "recommended_template": "template_key",
-  "confidence": 0.95,
-  "reasoning": "Brief explanation",
-  "requires_dynamic_template": false,
-  "procedure_type": "Procedure name"
-}}
-
-Respond ONLY with valid JSON."""
-    
     try:
-        response = gemini_model.generate_content(prompt)
-        cleaned_json = response.text.strip()
-        for marker in ["```json", "```"]:
-            cleaned_json = cleaned_json.replace(marker, "")
+        prompt = SELECT_PROMPT_PREFIX + str(raw_text) + SELECT_PROMPT_SUFFIX
+        cache_key = gemini_cache.key("select_template", raw_text)
+        result = gemini_cache.get(cache_key)
+        if result is None:
+            result = orjson.loads(strip_code_fences(generate_json_text(prompt)))
+            gemini_cache.put(cache_key, result)
         
-        result = json.loads(cleaned_json.strip())
-        
-        return jsonify(result)
+        return orjson_response(result)
     except Exception as e:
-        logging.error(f"Template selection error: {e}")
-        return jsonify({"error": str(e)}), 500
+        logging.error("Template selection error: %s", e)
+        return orjson_response({"error": str(e)}, 500)
 
 @app.route("/generate_dynamic_template", methods=["POST"])
 def generate_dynamic_template():
     """Generate a custom template based on the dictated content"""
     if not gemini_model:
-        return jsonify({"error": "Gemini is not configured"}), 500
+        return orjson_response({"error": "Gemini is not configured"}, 500)
     
     data = request.get_json()
     if not data or "text" not in data:
-        return jsonify({"error": "Missing 'text' field"}), 400
+        return orjson_response({"error": "Missing 'text' field"}, 400)
     
     raw_text = data["text"]
     procedure_type = data.get("procedure_type", "medical procedure")
     
-    prompt = f"""You are an expert medical documentation specialist.
-
-TASK: Create a professional medical procedure template based on the dictated content.
-
-DICTATED TEXT:
----
-{raw_text}
----
-
-PROCEDURE TYPE: {procedure_type}
-
-INSTRUCTIONS:
-1. Analyze the dictated content structure
-2. Create a professional template with appropriate sections
-3. Use placeholders {{field_name}} for variable content
-4. Include standard sections: Date, Diagnoses, Procedures, Complications, etc.
-5. Match the style and detail level of the dictation
-
-REFERENCE FORMAT:
-Procedure Date: {{date}}
-
-Preoperative Diagnosis:
-1. {{preop_dx}}
-
-Postoperative Diagnosis:
-1. {{postop_dx}}
-
-Procedure Performed:
-1. {{procedure_name}}
-
-[Additional relevant sections based on content]
-
-OUTPUT: Return ONLY the template text with placeholders. No JSON, no explanation."""
-    
     try:
+        prompt = DYNAMIC_PROMPT_PREFIX + str(raw_text) + DYNAMIC_PROMPT_MIDDLE + str(procedure_type) + DYNAMIC_PROMPT_SUFFIX
         start_time = time.time()
-        response = gemini_model.generate_content(prompt)
-        template_text = response.text.strip()
-        
-        # Remove markdown formatting if present
-        template_text = template_text.replace("```", "").strip()
+        response = gemini_model.generate_content(prompt, request_options={"timeout": GEMINI_TIMEOUT_S})
+        template_text = strip_code_fences(response.text)
         
         duration = time.time() - start_time
         template_id = str(uuid.uuid4())
         
-        logging.info(f"Dynamic template generated in {duration:.2f}s")
+        logging.info("Dynamic template generated in %.2fs", duration)
         
-        return jsonify({
+        return orjson_response({
             "template_id": template_id,
             "template": template_text,
             "generation_time": duration,
             "procedure_type": procedure_type
         })
     except Exception as e:
-        logging.error(f"Dynamic template generation error: {e}")
-        return jsonify({"error": str(e)}), 500
+        logging.error("Dynamic template generation error: %s", e)
+        return orjson_response({"error": str(e)}, 500)
 
 @app.route("/process_note", methods=["POST"])
 def process_note():
     """Enhanced note processing with dynamic template support"""
     if not gemini_model:
-        return jsonify({"error": "Gemini is not configured"}), 500
+        return orjson_response({"error": "Gemini is not configured"}, 500)
 
     data = request.get_json()
     if not data or "text" not in data:
-        return jsonify({"error": "Missing 'text'"}), 400
+        return orjson_response({"error": "Missing 'text'"}, 400)
 
     raw_text = data["text"]
     template_key = data.get("macro_key")
@@ -455,58 +1434,32 @@ def process_note():
         template_text = STATIC_TEMPLATES[template_key]
         template_source = "static"
     else:
-        return jsonify({"error": "Must provide either 'macro_key' or 'custom_template'"}), 400
+        return orjson_response({"error": "Must provide either 'macro_key' or 'custom_template'"}, 400)
 
     start_time = time.time()
     note_id = str(uuid.uuid4())
 
-    prompt = f"""You are an expert medical scribe with advanced entity extraction capabilities using Gemini 2.5.
-
-TASK: Extract structured information from dictated medical text and fill template placeholders with high accuracy.
-
-DICTATED TEXT:
----
-{raw_text}
----
-
-TEMPLATE TO FILL:
----
-{template_text}
----
-
-INSTRUCTIONS:
-1. Identify all placeholders in the template (format: {{field_name}})
-2. Extract corresponding information from the dictated text
-3. Use advanced reasoning to infer missing information when appropriate
-4. Assign confidence scores (0.0-1.0):
-   - 1.0: Explicitly stated, unambiguous
-   - 0.8-0.9: Clearly implied or paraphrased  
-   - 0.5-0.7: Inferred from medical context
-   - 0.0-0.4: Uncertain or not found
-5. Maintain medical terminology accuracy
-6. For dates, use format: MM/DD/YYYY
-
-OUTPUT FORMAT (JSON only, no markdown):
-{{
-  "field_name": {{
-    "value": "extracted text",
-    "confidence": 0.95,
-    "source": "explicit|inferred|contextual"
-  }}
-}}
-
-Respond ONLY with valid JSON."""
-
     try:
-        logging.info(f"[{note_id}] Processing note with Gemini 2.5...")
-        response = gemini_model.generate_content(prompt)
-        
-        cleaned_json = response.text.strip()
-        for marker in ["```json", "```"]:
-            cleaned_json = cleaned_json.replace(marker, "")
-        cleaned_json = cleaned_json.strip()
-        
-        filled_json = json.loads(cleaned_json)
+        cache_key = gemini_cache.key("process_note", raw_text, str(template_text))
+        filled_json = gemini_cache.get(cache_key)
+        if filled_json is not None:
+            extraction_method = "cache"
+        else:
+            logging.info("[%s] Processing note with Gemini 2.5...", note_id)
+            meta = _template_meta(template_text)
+            prompt = NOTE_PROMPT_PREFIX + str(raw_text) + meta.prompt_suffix
+            response_text = generate_json_text(prompt)
+            
+            filled_json, extraction_method = parse_gemini_fields(response_text)
+            if filled_json is None:
+                logging.warning("[%s] Unparseable AI response, using regex fallback", note_id)
+                filled_json = _fallback_extraction(raw_text, meta)
+                extraction_method = "fallback"
+            elif extraction_method == "repaired":
+                logging.warning("[%s] Malformed AI response, kept %d repaired fields", note_id, len(filled_json))
+            else:
+                # Repaired or fallback results are partial; never replay them
+                gemini_cache.put(cache_key, filled_json)
         duration = time.time() - start_time
         
         # Calculate metrics
@@ -526,7 +1479,7 @@ Respond ONLY with valid JSON."""
             id=note_id,
             timestamp=datetime.now(),
             template_key=template_key,
-            template_source=template_source,
+            template_source="cache" if extraction_method == "cache" else template_source,
             processing_time=duration,
             field_count=len(filled_json),
             low_confidence_count=len(low_confidence_fields),
@@ -534,31 +1487,28 @@ Respond ONLY with valid JSON."""
         )
         metrics_tracker.log_template_usage(metric)
         
-        if low_confidence_fields:
-            logging.warning(f"[{note_id}] Low confidence fields: {', '.join(low_confidence_fields)}")
+        if low_confidence_fields and logging.getLogger().isEnabledFor(logging.WARNING):
+            logging.warning("[%s] Low confidence fields: %s", note_id, ", ".join(low_confidence_fields))
         
-        logging.info(f"[{note_id}] Processing complete in {duration:.2f}s")
+        logging.info("[%s] Processing complete in %.2fs", note_id, duration)
         
-        return jsonify({
+        return orjson_response({
             "note_id": note_id,
             "fields": filled_json,
             "metadata": {
                 "processing_time": duration,
                 "template_key": template_key,
                 "template_source": template_source,
+                "extraction_method": extraction_method,
                 "avg_confidence": avg_confidence,
                 "low_confidence_count": len(low_confidence_fields),
                 "low_confidence_fields": low_confidence_fields
             }
         })
         
-    except json.JSONDecodeError as e:
-        logging.error(f"[{note_id}] JSON parsing error: {e}")
-        return jsonify({"error": "Failed to parse AI response"}), 500
-            
     except Exception as e:
-        logging.error(f"[{note_id}] Processing error: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+        logging.error("[%s] Processing error: %s", note_id, e, exc_info=True)
+        return orjson_response({"error": str(e)}, 500)
 
 @app.route("/report_correction", methods=["POST"])
 def report_correction():
@@ -566,16 +1516,16 @@ def report_correction():
     data = request.get_json()
     
     if not data or "note_id" not in data:
-        return jsonify({"error": "Missing 'note_id'"}), 400
+        return orjson_response({"error": "Missing 'note_id'"}, 400)
     
     note_id = data["note_id"]
     corrections = data.get("corrections", [])
     
     # Update metrics with correction count
     # In production, you'd update the existing metric entry
-    logging.info(f"[{note_id}] User made {len(corrections)} corrections")
+    logging.info("[%s] User made %d corrections", note_id, len(corrections))
     
-    return jsonify({
+    return orjson_response({
         "status": "recorded",
         "note_id": note_id,
         "correction_count": len(corrections)
@@ -587,52 +1537,61 @@ def get_metrics():
     days = request.args.get('days', default=7, type=int)
     summary = metrics_tracker.get_summary(days)
     
-    return jsonify(summary)
+    return orjson_response(summary)
+
+@app.route("/validate_macro/<macro_key>")
+def validate_macro(macro_key):
+    """List the placeholder fields a static template requires"""
+    if macro_key not in STATIC_TEMPLATES:
+        return orjson_response({"error": f"Unknown macro '{macro_key}'"}, 404)
+    return cached_json_response(VALIDATE_MACRO_BODIES[macro_key])
 
 @app.route("/list_templates")
 def list_templates():
     """List all available static templates"""
-    return jsonify({
-        "templates": list(STATIC_TEMPLATES.keys()),
-        "count": len(STATIC_TEMPLATES)
-    })
+    return cached_json_response(LIST_TEMPLATES_BODY)
 
 # WebSocket for real-time transcription
 @socketio.on('connect')
 def handle_connect():
     session_id = request.sid
-    logging.info(f"Client connected: {session_id}")
+    realtime_sessions[session_id] = RealtimeSession(REALTIME_BUFFER_S * SAMPLE_RATE)
+    logging.info("Client connected: %s", session_id)
     emit('connection_response', {'status': 'connected', 'session_id': session_id})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     session_id = request.sid
-    if session_id in realtime_sessions:
-        del realtime_sessions[session_id]
-    logging.info(f"Client disconnected: {session_id}")
+    realtime_sessions.pop(session_id, None)
+    logging.info("Client disconnected: %s", session_id)
 
 @socketio.on('audio_chunk')
 def handle_audio_chunk(data):
-    """Handle real-time audio streaming"""
+    """Buffer a chunk of 16 kHz mono PCM16 audio (binary or base64)
+
+    Transcripts arrive asynchronously as 'transcription_chunk' events from
+    the background flusher; send is_final to get one last pass over
+    everything buffered.
+    """
     session_id = request.sid
     
+    # Sessions are created on connect; a chunk handled after disconnect
+    # must not resurrect one that nothing would remove
+    session = realtime_sessions.get(session_id)
+    if session is None:
+        return
+    
     try:
-        # In production, you'd buffer chunks and transcribe periodically
-        # This is a simplified version
-        audio_data = data.get('audio')
+        audio_data = data.get('audio') or b""
+        if isinstance(audio_data, str):
+            audio_data = base64.b64decode(audio_data)
+        samples = np.frombuffer(audio_data, dtype='<i2', count=len(audio_data) // 2).astype(np.float32)
+        samples *= 1 / 32768
         
-        if not audio_data:
-            return
-        
-        # Process audio chunk (simplified - would need proper buffering)
-        emit('transcription_chunk', {
-            'text': '[Real-time transcription]',
-            'timestamp': time.time(),
-            'is_final': data.get('is_final', False)
-        })
+        session.write(samples, bool(data.get('is_final', False)))
         
     except Exception as e:
-        logging.error(f"Real-time transcription error: {e}")
+        logging.error("Real-time transcription error: %s", e)
         emit('error', {'message': str(e)})
 
 if __name__ == "__main__":
@@ -644,5 +1603,5 @@ if __name__ == "__main__":
     logging.info("Features: Dynamic Templates | Batch | Real-time | Metrics")
     logging.info("=" * 70)
     
-    # Use SocketIO for WebSocket support
+    # Development server only; production runs under gunicorn (see Dockerfile)
     socketio.run(app, host="0.0.0.0", port=5005, allow_unsafe_werkzeug=True)
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""CPU-bound text helpers for dragon_gpu_server.
+
+Kept free of Flask, model and third-party state and fully type-annotated so
+the Docker build can compile this module with mypyc; the plain .py file is
+used unchanged when no compiled extension is present.
+"""
+import re
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+FieldPattern = Tuple[str, Pattern[str]]
+FieldValue = Dict[str, Union[str, float]]
+
+# Leading ```json / ```text / ``` and trailing ``` fences around a Gemini reply
+_FENCE_RE = re.compile(r'\A\s*```[\w-]*\s*|\s*```\s*\Z')
+_PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+
+def strip_code_fences(text: str) -> str:
+    """Remove a markdown code fence wrapping the whole text, leaving its contents untouched"""
+    return _FENCE_RE.sub("", text).strip()
+
+
+class JsonObjectScanner:
+    """Incrementally tracks brace depth to find where the top-level JSON object ends"""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> int:
+        """Return the index just past the closing brace in text, or -1 if still open"""
+        for idx, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth:
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}" and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return idx + 1
+        return -1
+
+
+def extract_fields(template_text: str) -> List[str]:
+    """Unique {placeholder} names in order of first appearance"""
+    return list(dict.fromkeys(_PLACEHOLDER_RE.findall(template_text)))
+
+
+def compile_field_patterns(fields: List[str]) -> List[FieldPattern]:
+    """(field, pattern) pairs matching e.g. "preop dx: ..." up to the next period"""
+    return [
+        (field, re.compile(rf'\b{field.replace("_", "[ _]")}\b[:\s]+([^.]+)', re.IGNORECASE))
+        for field in fields
+    ]
+
+
+def match_fields(text: str, patterns: List[FieldPattern],
+                 hits: Optional[Dict[int, Optional[int]]]) -> Dict[str, FieldValue]:
+    """Extract each field's value from text
+
+    hits optionally maps pattern index -> leftmost start offset (or None if
+    only presence is known), as produced by a multi-pattern prefilter;
+    indexes missing from hits are known not to match.
+    """
+    fields: Dict[str, FieldValue] = {}
+    for idx, (field, pattern) in enumerate(patterns):
+        if hits is None:
+            match = pattern.search(text)
+        elif idx not in hits:
+            match = None
+        else:
+            start = hits[idx]
+            match = pattern.search(text) if start is None else pattern.match(text, start)
+        if match:
+            fields[field] = {"value": match.group(1).strip(), "confidence": 0.5, "source": "fallback"}
+        else:
+            fields[field] = {"value": "", "confidence": 0.0, "source": "fallback"}
+    return fields
@@ -0,0 +1,18 @@
+# Gunicorn settings for dragon_gpu_server (loaded automatically from the
+# working directory).
+#
+# A single worker keeps one copy of the Whisper model in VRAM, and threads
+# handle concurrency. Most request threads spend their time waiting on
+# Gemini or the GPU queue rather than on the CPU, so the thread count can
+# be raised well past the core count.
+import os
+
+bind = "0.0.0.0:5005"
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+# Gunicorn counts the timeout from worker spawn, and the first boot imports
+# the app with the model download, optional calibration and GPU warm-up
+# included. Request threads do not feed the heartbeat, so a long timeout
+# only delays recovery from a genuinely hung worker.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "1800"))